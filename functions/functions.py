@@ -3,139 +3,292 @@ Tool function declarations
 
 This file provides the function declearations and schemas for
 the agent to use
+
+google.genai is only imported once a schema or dispatch_tool_call needs
+it. Script workers import this module (and re-import main.py), so they
+start without the SDK. Environment variables are read at import time;
+load the .env file before importing this module.
 """
+from __future__ import annotations
 
+import asyncio
+import logging
+import multiprocessing
 import os
-import subprocess
-from typing import Any, Dict, List, Optional
-
-from dotenv import load_dotenv
-from google.genai import types
-
-load_dotenv()
+import runpy
+import stat
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+_WORKING_DIR = os.environ.get("WORKING_DIR", "")
+# Symlinks are resolved so a link inside the working directory cannot be
+# used to reach files outside of it.
+_ABS_WORKING_DIR = os.path.realpath(_WORKING_DIR)
+# Prefix every sandboxed path must start with. Keeps a single separator
+# even when the working directory is a filesystem root.
+_SAFE_BASE = _ABS_WORKING_DIR.rstrip(os.sep) + os.sep
+
+# Despite the name, this is a byte limit: read_file_content truncates the
+# raw file at this many bytes before decoding it.
+MAX_FILE_CHARS = int(
+    os.environ.get("MAX_FILE_CHARS")
+    or os.environ.get("FILE_CHARACTER_LIMIT")
+    or 10000
+)
+SCRIPT_TIMEOUT = 30
+LIST_CACHE_TTL = 5.0
+LIST_CACHE_MAX_ENTRIES = 128
+IO_CHUNK_SIZE = 1 << 20
+
+# Rendered directory listings keyed by absolute path, stored as
+# (expires_at, st_mtime_ns, listing).
+_LIST_CACHE: Dict[str, Tuple[float, int, str]] = {}
+# Bumped by clear_list_cache so a listing scanned before a mutation is not
+# stored after it.
+_LIST_CACHE_GENERATION = 0
+_LIST_CACHE_LOCK = threading.Lock()
+
+# Parent directories write_file_content has already created or seen.
+_KNOWN_DIRS: Set[str] = set()
+
+# Scripts run in processes forked from a warm fork server, so they skip
+# interpreter startup. Created on first use, see _get_worker_context.
+_WORKER_CONTEXT: Optional[multiprocessing.context.BaseContext] = None
+_WORKER_CONTEXT_LOCK = threading.Lock()
+
+# The agent's own package and directory, hidden from scripts run in workers.
+_AGENT_PACKAGE = __name__.partition(".")[0]
+_AGENT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # =========================
 # Tool schemas
 # =========================
 
-SCHEMA_LIST_DIRECTORY = types.FunctionDeclaration(
-    name="get_files_info",
-    description="Lists files in a directory with sizes and directory flags.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "directory": types.Schema(
-                type=types.Type.STRING,
-                description="Target directory relative to the working directory.",
-            )
-        },
-    ),
-)
-
-SCHEMA_READ_FILE = types.FunctionDeclaration(
-    name="get_file_content",
-    description="Returns the content of a file.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="Path to the file relative to the working directory.",
-            )
-        },
-    ),
-)
-
-SCHEMA_WRITE_FILE = types.FunctionDeclaration(
-    name="write_file",
-    description="Writes content to a file.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="Path to the file relative to the working directory.",
-            ),
-            "content": types.Schema(
-                type=types.Type.STRING,
-                description="Content to write to the file.",
-            ),
-        },
-    ),
-)
-
-SCHEMA_EXECUTE_PYTHON = types.FunctionDeclaration(
-    name="run_python_file",
-    description="Runs a Python file.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="Python file path relative to the working directory.",
-            ),
-            "args": types.Schema(
-                type=types.Type.ARRAY,
-                items=types.Schema(type=types.Type.STRING),
-                description="Optional command-line arguments.",
-            ),
-        },
-    ),
+_SCHEMA_NAMES = (
+    "SCHEMA_LIST_DIRECTORY",
+    "SCHEMA_READ_FILE",
+    "SCHEMA_WRITE_FILE",
+    "SCHEMA_EXECUTE_PYTHON",
 )
+_SCHEMA_LOCK = threading.Lock()
+
+
+def _build_schemas() -> None:
+    """Import google.genai and create the SCHEMA_* declarations."""
+    global SCHEMA_LIST_DIRECTORY, SCHEMA_READ_FILE
+    global SCHEMA_WRITE_FILE, SCHEMA_EXECUTE_PYTHON
+
+    from google.genai import types
+
+    SCHEMA_LIST_DIRECTORY = types.FunctionDeclaration(
+        name="get_files_info",
+        description="Lists files in a directory with sizes and directory flags.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "directory": types.Schema(
+                    type=types.Type.STRING,
+                    description="Target directory relative to the working directory.",
+                )
+            },
+        ),
+    )
+
+    SCHEMA_READ_FILE = types.FunctionDeclaration(
+        name="get_file_content",
+        description="Returns the content of a file.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "file_path": types.Schema(
+                    type=types.Type.STRING,
+                    description="Path to the file relative to the working directory.",
+                )
+            },
+        ),
+    )
+
+    SCHEMA_WRITE_FILE = types.FunctionDeclaration(
+        name="write_file",
+        description="Writes content to a file.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "file_path": types.Schema(
+                    type=types.Type.STRING,
+                    description="Path to the file relative to the working directory.",
+                ),
+                "content": types.Schema(
+                    type=types.Type.STRING,
+                    description="Content to write to the file.",
+                ),
+            },
+        ),
+    )
+
+    SCHEMA_EXECUTE_PYTHON = types.FunctionDeclaration(
+        name="run_python_file",
+        description="Runs a Python file.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "file_path": types.Schema(
+                    type=types.Type.STRING,
+                    description="Python file path relative to the working directory.",
+                ),
+                "args": types.Schema(
+                    type=types.Type.ARRAY,
+                    items=types.Schema(type=types.Type.STRING),
+                    description="Optional command-line arguments.",
+                ),
+                "clean_interpreter": types.Schema(
+                    type=types.Type.BOOLEAN,
+                    description=(
+                        "Run the file in a new Python interpreter instead "
+                        "of a pre-started worker. Slower; use it if the "
+                        "script behaves differently than under `python`."
+                    ),
+                ),
+            },
+        ),
+    )
+
+
+def __getattr__(name: str) -> Any:
+    """Build the schemas on first access (PEP 562)."""
+    if name in _SCHEMA_NAMES:
+        with _SCHEMA_LOCK:
+            if name not in globals():
+                _build_schemas()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # =========================
 # Tool implementations
 # =========================
 
+def _abs_base_dir(working_directory: str) -> str:
+    """Return the resolved working directory, reusing the cached one."""
+    if working_directory in (_WORKING_DIR, _ABS_WORKING_DIR):
+        return _ABS_WORKING_DIR
+    return os.path.realpath(working_directory)
+
+
+def _is_within(base_dir: str, target: str) -> bool:
+    """Check that target is base_dir or lies underneath it."""
+    if base_dir == _ABS_WORKING_DIR:
+        safe_base = _SAFE_BASE
+    else:
+        safe_base = base_dir.rstrip(os.sep) + os.sep
+    return target == safe_base[:-1] or target.startswith(safe_base)
+
+
 def list_directory_contents(
     working_directory: str,
     directory: str = ".",
 ) -> str:
     """List files and directories within a working directory."""
-    base_dir = os.path.abspath(working_directory)
-    target_dir = os.path.abspath(os.path.join(base_dir, directory))
+    base_dir = _abs_base_dir(working_directory)
+    target_dir = os.path.realpath(os.path.join(base_dir, directory))
 
-    if os.path.commonpath([base_dir, target_dir]) != base_dir:
+    if not _is_within(base_dir, target_dir):
         return f"Error: {directory} is outside the working directory."
 
-    if not os.path.isdir(target_dir):
+    try:
+        dir_stat = os.stat(target_dir)
+    except OSError:
+        dir_stat = None
+    if dir_stat is None or not stat.S_ISDIR(dir_stat.st_mode):
         return f"Error: {directory} is not a valid directory."
 
+    cached = _LIST_CACHE.get(target_dir)
+    if (
+        cached
+        and cached[0] > time.monotonic()
+        and cached[1] == dir_stat.st_mtime_ns
+    ):
+        return cached[2]
+
+    generation = _LIST_CACHE_GENERATION
     try:
         lines: List[str] = []
-        for name in os.listdir(target_dir):
-            path = os.path.join(target_dir, name)
-            is_dir = os.path.isdir(path)
-            size = 0 if is_dir else os.path.getsize(path)
-            lines.append(
-                f"{name}: file_size={size} bytes, is_dir={is_dir}"
-            )
-        return "\n".join(lines)
+        with os.scandir(target_dir) as entries:
+            for entry in entries:
+                is_dir = entry.is_dir()
+                size = 0 if is_dir else entry.stat().st_size
+                lines.append(
+                    f"{entry.name}: file_size={size} bytes, is_dir={is_dir}"
+                )
+        listing = "\n".join(lines)
     except Exception as exc:
         return f"Error listing directory: {exc}"
 
+    with _LIST_CACHE_LOCK:
+        if generation == _LIST_CACHE_GENERATION:
+            _store_listing(target_dir, dir_stat.st_mtime_ns, listing)
+    return listing
+
+
+def _store_listing(target_dir: str, mtime_ns: int, listing: str) -> None:
+    """Cache a listing, evicting expired and then oldest entries."""
+    now = time.monotonic()
+    for key in [key for key, entry in _LIST_CACHE.items() if entry[0] <= now]:
+        del _LIST_CACHE[key]
+    _LIST_CACHE.pop(target_dir, None)
+    while len(_LIST_CACHE) >= LIST_CACHE_MAX_ENTRIES:
+        del _LIST_CACHE[next(iter(_LIST_CACHE))]
+    _LIST_CACHE[target_dir] = (now + LIST_CACHE_TTL, mtime_ns, listing)
+
+
+def clear_list_cache() -> None:
+    """Drop all cached directory listings."""
+    global _LIST_CACHE_GENERATION
+    with _LIST_CACHE_LOCK:
+        _LIST_CACHE_GENERATION += 1
+        _LIST_CACHE.clear()
+
 
 def read_file_content(
     working_directory: str,
     file_path: str,
 ) -> str:
     """Read and return file contents (truncated if needed)."""
-    max_chars = int(os.environ.get("MAX_FILE_CHARS", "10000"))
-    base_dir = os.path.abspath(working_directory)
-    target_file = os.path.abspath(os.path.join(base_dir, file_path))
+    base_dir = _abs_base_dir(working_directory)
+    target_file = os.path.realpath(os.path.join(base_dir, file_path))
 
-    if os.path.commonpath([base_dir, target_file]) != base_dir:
+    if not _is_within(base_dir, target_file):
         return "Error: File is outside the working directory."
 
-    if not os.path.isfile(target_file):
+    try:
+        file_stat = os.stat(target_file)
+    except OSError:
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
         return f"Error: File not found: {file_path}"
 
     try:
-        with open(target_file, "r", encoding="utf-8") as file:
-            content = file.read(max_chars)
-
-        if os.path.getsize(target_file) > max_chars:
-            content += f"\n...File truncated at {max_chars} characters."
+        buffer = bytearray(min(file_stat.st_size, MAX_FILE_CHARS))
+        view = memoryview(buffer)
+        filled = 0
+        with open(target_file, "rb", buffering=0) as file:
+            while filled < len(buffer):
+                count = file.readinto(view[filled:])
+                if not count:
+                    break
+                filled += count
+        content = buffer[:filled].decode("utf-8", errors="replace")
+
+        if file_stat.st_size > MAX_FILE_CHARS:
+            content += f"\n...File truncated at {MAX_FILE_CHARS} bytes."
 
         return content
     except Exception as exc:
@@ -148,57 +301,267 @@ def write_file_content(
     content: str,
 ) -> str:
     """Write content to a file."""
-    base_dir = os.path.abspath(working_directory)
-    target_file = os.path.abspath(os.path.join(base_dir, file_path))
+    base_dir = _abs_base_dir(working_directory)
+    target_file = os.path.realpath(os.path.join(base_dir, file_path))
 
-    if os.path.commonpath([base_dir, target_file]) != base_dir:
+    if not _is_within(base_dir, target_file):
         return "Error: File path is outside the working directory."
 
+    parent_dir = os.path.dirname(target_file)
     try:
-        os.makedirs(os.path.dirname(target_file), exist_ok=True)
-        with open(target_file, "w", encoding="utf-8") as file:
-            file.write(content)
+        if parent_dir not in _KNOWN_DIRS:
+            os.makedirs(parent_dir, exist_ok=True)
+            _KNOWN_DIRS.add(parent_dir)
+        data = memoryview(content.encode("utf-8"))
+        fd = os.open(target_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            while data:
+                written = os.write(fd, data[:IO_CHUNK_SIZE])
+                data = data[written:]
+        finally:
+            os.close(fd)
+        clear_list_cache()
         return f"Successfully wrote {len(content)} characters to {file_path}."
     except Exception as exc:
+        # The directory may have been removed since it was cached.
+        _KNOWN_DIRS.discard(parent_dir)
         return f"Error writing file: {exc}"
 
 
+def _run_script(
+    script_path: str,
+    args: List[str],
+    cwd: str,
+    stdout_path: str,
+    stderr_path: str,
+    result_conn: Any,
+) -> None:
+    """
+    Run a script inside a worker, the same way `python script` would.
+
+    Every worker runs exactly one script and then exits, so imported
+    modules, logging handlers, threads and other process-wide state never
+    leak into the next run. The agent's own modules and directory are
+    removed from sys.modules and sys.path first, so the script resolves
+    its imports against its own files.
+
+    Output is captured at the file descriptor level, so it includes child
+    processes and C extensions. stdout is line buffered, so lines printed
+    before an os._exit() are kept.
+
+    Isolation is still weaker than a new interpreter: modules preloaded
+    by the fork server (mostly the standard library) start out imported.
+    """
+    for fd, path in ((1, stdout_path), (2, stderr_path)):
+        output_fd = os.open(path, os.O_WRONLY)
+        os.dup2(output_fd, fd)
+        os.close(output_fd)
+    sys.stdout = open(1, "w", buffering=1, encoding="utf-8", closefd=False)
+    sys.stderr = open(
+        2,
+        "w",
+        buffering=1,
+        encoding="utf-8",
+        errors="backslashreplace",
+        closefd=False,
+    )
+    returncode = 0
+
+    for name in list(sys.modules):
+        if name in (_AGENT_PACKAGE, "__mp_main__") or name.startswith(
+            _AGENT_PACKAGE + "."
+        ):
+            del sys.modules[name]
+    sys.path[:] = [os.path.dirname(script_path)] + [
+        path for path in sys.path if os.path.abspath(path) != _AGENT_ROOT
+    ]
+    os.chdir(cwd)
+    sys.argv = [script_path, *args]
+    try:
+        runpy.run_path(script_path, run_name="__main__")
+    except SystemExit as exc:
+        if isinstance(exc.code, int) or exc.code is None:
+            returncode = exc.code or 0
+        else:
+            print(exc.code, file=sys.stderr)
+            returncode = 1
+    except BaseException as exc:
+        # Start at the script's own frame, skipping this function and
+        # runpy, so the traceback matches what `python script` prints.
+        tb = exc.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != script_path:
+            tb = tb.tb_next
+        traceback.print_exception(type(exc), exc, tb, file=sys.stderr)
+        returncode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    result_conn.send(returncode)
+    result_conn.close()
+
+
+def _get_worker_context() -> Optional[multiprocessing.context.BaseContext]:
+    """Return the fork server context, or None if the platform lacks it."""
+    global _WORKER_CONTEXT
+    with _WORKER_CONTEXT_LOCK:
+        if _WORKER_CONTEXT is None:
+            try:
+                context = multiprocessing.get_context("forkserver")
+            except ValueError:
+                return None
+            # Warm the server with this module instead of the agent's
+            # __main__, which would otherwise be preloaded by default.
+            # asyncio is listed on its own because some Python versions
+            # start the server without the parent's sys.path, and then
+            # this module only imports when run from the agent directory.
+            context.set_forkserver_preload(["asyncio", __name__])
+            _WORKER_CONTEXT = context
+        return _WORKER_CONTEXT
+
+
+def _make_output_file() -> str:
+    """Create an empty temporary file for a worker's output."""
+    fd, path = tempfile.mkstemp(prefix="noai-", suffix=".out")
+    os.close(fd)
+    return path
+
+
+def _read_output_file(path: str) -> str:
+    """Return what a worker wrote to one of its output files."""
+    with open(path, "rb") as file:
+        return file.read().decode("utf-8", errors="replace")
+
+
+def _run_script_in_worker(
+    context: multiprocessing.context.BaseContext,
+    script_path: str,
+    args: List[str],
+    cwd: str,
+) -> Tuple[str, str, int]:
+    """Run a script in its own process forked from the fork server."""
+    stdout_path, stderr_path = _make_output_file(), _make_output_file()
+    reader, writer = context.Pipe(duplex=False)
+    worker = context.Process(
+        target=_run_script,
+        args=(script_path, args, cwd, stdout_path, stderr_path, writer),
+    )
+    try:
+        worker.start()
+        writer.close()
+        # The timeout only starts once this script's worker is running.
+        if not reader.poll(SCRIPT_TIMEOUT):
+            worker.kill()
+            worker.join()
+            raise TimeoutError
+        try:
+            returncode: Optional[int] = reader.recv()
+        except EOFError:
+            # The script ended the process itself, e.g. with os._exit().
+            returncode = None
+
+        worker.join(timeout=1)
+        if worker.is_alive():
+            worker.kill()
+        worker.join()
+        if returncode is None:
+            returncode = worker.exitcode
+
+        return (
+            _read_output_file(stdout_path),
+            _read_output_file(stderr_path),
+            returncode,
+        )
+    finally:
+        writer.close()
+        reader.close()
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+        os.unlink(stdout_path)
+        os.unlink(stderr_path)
+
+
+async def _run_script_in_subprocess(
+    script_path: str,
+    args: List[str],
+    cwd: str,
+) -> Tuple[str, str, int]:
+    """Run a script in a fresh interpreter, draining its pipes as it runs."""
+    process = await asyncio.create_subprocess_exec(
+        "python",
+        script_path,
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(), timeout=SCRIPT_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return (
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+        process.returncode,
+    )
+
+
 def execute_python_script(
     working_directory: str,
     file_path: str,
     args: Optional[List[str]] = None,
+    clean_interpreter: bool = False,
 ) -> str:
-    """Execute a Python script."""
+    """
+    Execute a Python script.
+
+    Scripts run in a worker forked from a warm fork server by default,
+    see _run_script for how far that is isolated. Pass
+    `clean_interpreter=True` for scripts that need a fresh interpreter.
+    """
     args = args or []
-    base_dir = os.path.abspath(working_directory)
-    target_file = os.path.abspath(os.path.join(base_dir, file_path))
+    base_dir = _abs_base_dir(working_directory)
+    target_file = os.path.realpath(os.path.join(base_dir, file_path))
 
-    if os.path.commonpath([base_dir, target_file]) != base_dir:
+    if not _is_within(base_dir, target_file):
         return "Error: Script is outside the working directory."
 
     if not target_file.endswith(".py"):
         return "Error: Target file is not a Python script."
 
+    context = None if clean_interpreter else _get_worker_context()
     try:
-        result = subprocess.run(
-            ["python", target_file, *args],
-            capture_output=True,
-            text=True,
-            timeout=30,
-            cwd=base_dir,
-        )
+        if context is not None:
+            stdout, stderr, returncode = _run_script_in_worker(
+                context, target_file, args, base_dir
+            )
+        else:
+            stdout, stderr, returncode = asyncio.run(
+                _run_script_in_subprocess(target_file, args, base_dir)
+            )
 
         output = []
-        if result.stdout:
-            output.append(f"STDOUT:\n{result.stdout}")
-        if result.stderr:
-            output.append(f"STDERR:\n{result.stderr}")
-        if result.returncode != 0:
-            output.append(f"Exit code: {result.returncode}")
+        if stdout:
+            output.append(f"STDOUT:\n{stdout}")
+        if stderr:
+            output.append(f"STDERR:\n{stderr}")
+        if returncode != 0:
+            output.append(f"Exit code: {returncode}")
 
         return "\n".join(output) or "Script executed successfully."
+    except (TimeoutError, asyncio.TimeoutError):
+        return f"Error executing script: timed out after {SCRIPT_TIMEOUT} seconds"
     except Exception as exc:
         return f"Error executing script: {exc}"
+    finally:
+        # The script may have created, removed or resized files.
+        clear_list_cache()
+        _KNOWN_DIRS.clear()
 
 
 # =========================
@@ -212,18 +575,21 @@ TOOL_FUNCTION_MAP: Dict[str, Any] = {
     "run_python_file": execute_python_script,
 }
 
+# Tools that don't modify the working directory and so may run concurrently.
+READ_ONLY_TOOLS = frozenset({"get_files_info", "get_file_content"})
+
 
 def dispatch_tool_call(
     tool_call: Any,
-    verbose: bool = False,
 ) -> types.Content:
     """Dispatch a tool call and return a Gemini-compatible response."""
+    from google.genai import types
+
     tool_name: str = tool_call.name
     args: Dict[str, Any] = dict(tool_call.args)
-    args["working_directory"] = os.environ.get("WORKING_DIR", "")
+    args["working_directory"] = _ABS_WORKING_DIR
 
-    if verbose:
-        print(f"Calling tool: {tool_name} with args: {args}")
+    logger.debug("Calling tool: %s with args: %s", tool_name, args)
 
     try:
         if tool_name not in TOOL_FUNCTION_MAP:
@@ -16,29 +16,38 @@ just make sure to specify the directory correctly in the .env file.
 
 Author: CadetBluePaper
 """
+from __future__ import annotations
+
 import os
+import sys
 import argparse
-from typing import List
+import asyncio
+import logging
+from typing import TYPE_CHECKING, List
 
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
 
-from functions.functions import (
-    SCHEMA_LIST_DIRECTORY,
-    SCHEMA_READ_FILE,
-    SCHEMA_WRITE_FILE,
-    SCHEMA_EXECUTE_PYTHON,
-    dispatch_tool_call,
-)
+# functions.functions reads its settings from the environment on import.
+load_dotenv()
+
+from functions.functions import READ_ONLY_TOOLS, dispatch_tool_call
+
+# Script workers re-import this file, so the SDK is only imported inside
+# the functions that talk to the model.
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
 
 MODEL_NAME = "gemini-2.5-flash"
 MAX_ITERATIONS = 20
 
+logger = logging.getLogger(__name__)
+
 
 def main() -> None:
     """Entry point for the Gemini agent application."""
-    load_dotenv()
+    from google import genai
+    from google.genai import types
 
     api_key: str | None = os.environ.get("GEMINI_API_KEY")
     system_instruction: str | None = os.environ.get("SYSTEM_PROMPT")
@@ -66,6 +75,16 @@ def main() -> None:
 
     cli_args = parser.parse_args()
 
+    if cli_args.verbose:
+        # Only the agent's own loggers print to stdout; other libraries
+        # keep Python's default of warnings and above on stderr.
+        verbose_handler = logging.StreamHandler(sys.stdout)
+        verbose_handler.setFormatter(logging.Formatter("%(message)s"))
+        for logger_name in (__name__, "functions"):
+            verbose_logger = logging.getLogger(logger_name)
+            verbose_logger.setLevel(logging.DEBUG)
+            verbose_logger.addHandler(verbose_handler)
+
     conversation_history: List[types.Content] = [
         types.Content(
             role="user",
@@ -73,31 +92,42 @@ def main() -> None:
         )
     ]
 
-    run_agent_loop(
-        client=client,
-        conversation_history=conversation_history,
-        verbose=cli_args.verbose,
-        system_instruction=system_instruction,
+    asyncio.run(
+        run_agent_loop(
+            client=client,
+            conversation_history=conversation_history,
+            system_instruction=system_instruction,
+        )
     )
 
 
-def run_agent_loop(
+async def run_agent_loop(
     client: genai.Client,
     conversation_history: List[types.Content],
-    verbose: bool,
     system_instruction: str,
     max_iterations: int = MAX_ITERATIONS,
 ) -> None:
     """
     Main feedback loop for the agent.
 
+    Model requests go through the SDK's async client so they do not block
+    the event loop. Tool calls are dispatched by dispatch_tool_calls.
+
     Args:
         client: Gemini API client.
         conversation_history: Accumulated conversation history.
-        verbose: Enable verbose output.
         system_instruction: System prompt for the model.
         max_iterations: Maximum number of loop iterations.
     """
+    from google.genai import types
+
+    from functions.functions import (
+        SCHEMA_LIST_DIRECTORY,
+        SCHEMA_READ_FILE,
+        SCHEMA_WRITE_FILE,
+        SCHEMA_EXECUTE_PYTHON,
+    )
+
     available_tools = types.Tool(
         function_declarations=[
             SCHEMA_LIST_DIRECTORY,
@@ -106,42 +136,38 @@ def run_agent_loop(
             SCHEMA_EXECUTE_PYTHON,
         ]
     )
+    generation_config = types.GenerateContentConfig(
+        tools=[available_tools],
+        system_instruction=system_instruction,
+    )
 
     for _ in range(max_iterations):
         try:
-            model_response = client.models.generate_content(
+            model_response = await client.aio.models.generate_content(
                 model=MODEL_NAME,
                 contents=conversation_history,
-                config=types.GenerateContentConfig(
-                    tools=[available_tools],
-                    system_instruction=system_instruction,
-                ),
+                config=generation_config,
             )
 
-            if verbose and model_response.usage_metadata:
-                print(
-                    f"Prompt tokens used: "
-                    f"{model_response.usage_metadata.prompt_token_count}"
-                )
-                print(
-                    f"Response tokens used: "
-                    f"{model_response.usage_metadata.candidates_token_count}"
+            usage = model_response.usage_metadata
+            if usage and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Prompt tokens used: %s", usage.prompt_token_count)
+                logger.debug(
+                    "Response tokens used: %s", usage.candidates_token_count
                 )
 
-            for candidate in model_response.candidates:
-                conversation_history.append(candidate.content)
+            conversation_history.extend(
+                candidate.content for candidate in model_response.candidates
+            )
 
             if model_response.text:
                 print(f"Final response: {model_response.text}")
                 break
 
             if model_response.function_calls:
-                for function_call in model_response.function_calls:
-                    tool_response = dispatch_tool_call(
-                        function_call,
-                        verbose=verbose,
-                    )
-                    conversation_history.append(tool_response)
+                conversation_history.extend(
+                    await dispatch_tool_calls(model_response.function_calls)
+                )
 
         except Exception as exc:
             print(f"Error during generation: {exc}")
@@ -149,6 +175,49 @@ def run_agent_loop(
     else:
         print("Max iterations reached without completion, exiting...")
 
-        
+
+async def dispatch_tool_calls(
+    function_calls: List[types.FunctionCall],
+) -> List[types.Content]:
+    """
+    Run the tool calls from one model response, keeping their order.
+
+    Consecutive read-only calls run concurrently in worker threads. Writes
+    and script runs wait for everything before them and run one at a time,
+    so a script always sees the files written ahead of it.
+
+    Args:
+        function_calls: Function calls returned by the model.
+
+    Returns:
+        The tool responses, in the same order as the calls.
+    """
+    tool_responses: List[types.Content] = []
+    read_batch: List[types.FunctionCall] = []
+
+    async def flush_read_batch() -> None:
+        tool_responses.extend(
+            await asyncio.gather(
+                *(
+                    asyncio.to_thread(dispatch_tool_call, function_call)
+                    for function_call in read_batch
+                )
+            )
+        )
+        read_batch.clear()
+
+    for function_call in function_calls:
+        if function_call.name in READ_ONLY_TOOLS:
+            read_batch.append(function_call)
+            continue
+        await flush_read_batch()
+        tool_responses.append(
+            await asyncio.to_thread(dispatch_tool_call, function_call)
+        )
+    await flush_read_batch()
+
+    return tool_responses
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file